@@ -2,7 +2,13 @@
 from nautobot.core.celery import register_jobs
 
 from .cve_tracking import GenerateVulnerabilities
+from .get_os_version import CreateSoftwareRel
 from .lifecycle_reporting import DeviceSoftwareValidationFullReport, InventoryItemSoftwareValidationFullReport
 
-jobs = [DeviceSoftwareValidationFullReport, InventoryItemSoftwareValidationFullReport, GenerateVulnerabilities]
+jobs = [
+    DeviceSoftwareValidationFullReport,
+    InventoryItemSoftwareValidationFullReport,
+    GenerateVulnerabilities,
+    CreateSoftwareRel,
+]
 register_jobs(*jobs)
@@ -0,0 +1,367 @@
+"""Job that queries devices for their running OS version and links them to Software objects."""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_migrate
+from nautobot.dcim.filters import DeviceFilterSet
+from nautobot.dcim.models import Device, DeviceType, Location, Platform
+from nautobot.extras.choices import LogLevelChoices
+from nautobot.extras.jobs import BooleanVar, IntegerVar, Job, MultiObjectVar
+from nautobot.extras.models import JobLogEntry, Relationship, RelationshipAssociation, Role, Tag
+from nautobot_plugin_nornir.constants import NORNIR_SETTINGS
+from nautobot_plugin_nornir.plugins.inventory.nautobot_orm import NautobotORMInventory
+from nornir import InitNornir
+from nornir.core.plugins.inventory import InventoryPluginRegister
+
+from nautobot_device_lifecycle_mgmt.models import SoftwareLCM
+
+name = "Device OS Version Query"  # pylint: disable=invalid-name
+
+# The scalar fields of a Device the job actually needs per host.
+DeviceStub = namedtuple("DeviceStub", ["id", "name", "platform_id", "primary_ip4"])
+
+
+class StubDeviceInventory(NautobotORMInventory):
+    """ORM inventory that stores a lightweight stub per host instead of the full Device.
+
+    Keeping every Device model instance (plus its joined relations) alive for the whole
+    run scales memory with fleet size; the job only reads a few scalar fields.
+    """
+
+    def create_host(self, device, cred, params):
+        """Build the host dict, replacing the Device instance with a DeviceStub."""
+        host = super().create_host(device, cred, params)
+        host["data"]["obj"] = DeviceStub(
+            id=device.id,
+            name=device.name,
+            platform_id=device.platform_id,
+            primary_ip4=str(device.primary_ip4.address.ip) if device.primary_ip4 else None,
+        )
+        return host
+
+
+# Guard against double registration when the module is imported more than once
+# (e.g. by both the jobs package and the Celery worker's job discovery).
+if "lcm-device-stub-inventory" not in InventoryPluginRegister.available:
+    InventoryPluginRegister.register("lcm-device-stub-inventory", StubDeviceInventory)
+
+FIELDS_PK = {
+    "location",
+    "device_type",
+    "role",
+    "platform",
+}
+
+FIELDS_NAME = {
+    "tags",
+}
+
+# Napalm drivers where a single CLI command returns the version far cheaper than a full
+# get_facts call, mapped to the command to run and the regex extracting the version.
+# Keyed on napalm driver names as set in host.data["napalm_driver"] by the inventory,
+# not on the netmiko-convention names a Platform's network_driver holds.
+VERSION_COMMANDS = {
+    "ios": ("show version | include Version", r"Version ([^,\s]+)"),
+    "nxos": ("show version | include version", r"version\s+(\S+)"),
+    "nxos_ssh": ("show version | include version", r"version\s+(\S+)"),
+    "eos": ("show version | include version", r"version:?\s+(\S+)"),
+}
+
+
+def get_version_only(task):
+    """Retrieve only the running OS version from a device.
+
+    get_facts pulls the whole facts dict (interfaces, serial, uptime, ...) while the job
+    needs a single string. Use the platform's cheap CLI path where one exists and fall
+    back to get_facts for the rest. The napalm driver is used directly rather than via
+    task.run subtasks, avoiding a MultiResult allocation per host and leaving napalm
+    exceptions unwrapped instead of buried in NornirSubTaskError.
+    """
+    conn = task.host.get_connection("napalm", task.nornir.config)
+    command_regex = VERSION_COMMANDS.get(task.host.data.get("napalm_driver"))
+    if command_regex:
+        command, regex = command_regex
+        match = re.search(regex, conn.cli([command])[command])
+        if match:
+            return match.group(1)
+    return conn.get_facts()["os_version"]
+
+
+@lru_cache(maxsize=1)
+def _get_device_soft_rel():
+    """Return the device_soft Relationship, memoized for the lifetime of the worker.
+
+    The row is effectively a configuration constant; it only changes when the app's
+    relationship schema migrates, which clears the cache below.
+    """
+    return Relationship.objects.get(key="device_soft")
+
+
+def _clear_device_soft_rel_cache(sender, **kwargs):  # pylint: disable=unused-argument
+    """Drop the memoized Relationship after migrations may have recreated it."""
+    _get_device_soft_rel.cache_clear()
+
+
+post_migrate.connect(_clear_device_soft_rel_cache)
+
+
+def get_job_filter(data=None):
+    """Helper function returning the device queryset the job should run against."""
+    if not data:
+        data = {}
+    query = {}
+
+    # Translate instances from FIELDS_PK set to list of primary keys; the v2 filters
+    # accept UUIDs directly. The form already materialized these querysets, so iterate
+    # them instead of re-querying.
+    for field in FIELDS_PK:
+        if data.get(field):
+            query[field] = [obj.pk for obj in data[field]]
+
+    # Translate instances from FIELDS_NAME set to list of names
+    for field in FIELDS_NAME:
+        if data.get(field):
+            query[field] = [obj.name for obj in data[field]]
+
+    if data.get("device"):
+        query.update({"id": [obj.pk for obj in data["device"]]})
+
+    # Binding the full DeviceFilterSet walks every filter field; skip it for "run on all".
+    if query:
+        devices = DeviceFilterSet(data=query, queryset=Device.objects.all()).qs
+    else:
+        devices = Device.objects.all()
+
+    # Only the names are needed for the error messages; don't pull full Device rows.
+    missing_platform = list(devices.filter(platform__isnull=True).values_list("name", flat=True))
+    if missing_platform:
+        raise ValueError(f"The following devices have no platform defined: {', '.join(missing_platform)}")
+
+    missing_primary_ip = list(devices.filter(primary_ip4__isnull=True).values_list("name", flat=True))
+    if missing_primary_ip:
+        raise ValueError(f"The following devices have no primary IPv4 defined: {', '.join(missing_primary_ip)}")
+
+    # Incremental mode: skip devices that already have a software relationship, turning a
+    # full-fleet reconciliation into a query of only the unlinked devices.
+    if data.get("only_missing"):
+        devices = devices.annotate(
+            has_rel=Exists(
+                RelationshipAssociation.objects.filter(relationship__key="device_soft", destination_id=OuterRef("pk"))
+            )
+        ).filter(has_rel=False)
+
+    # Join the relations the Nornir inventory and the per-host task touch, so building
+    # the inventory doesn't trigger one SELECT per device per accessed relation.
+    return devices.select_related("platform", "primary_ip4", "location", "role", "device_type__manufacturer")
+
+
+def init_nornir(queryset, workers=None):
+    """Initialize a Nornir instance over the given device queryset.
+
+    The napalm calls are network-bound, so the job always uses the threaded runner; the
+    worker count defaults to the deployment's NORNIR_SETTINGS and can be raised per run.
+    Nornir worker threads get their own database connections, so any ORM access from task
+    code must call django.db.close_old_connections() to avoid stale connections.
+    """
+    if not workers:
+        workers = int(NORNIR_SETTINGS.get("runner", {}).get("options", {}).get("num_workers", 64))
+    return InitNornir(
+        runner={"plugin": "threaded", "options": {"num_workers": workers}},
+        logging={"enabled": False},
+        inventory={
+            "plugin": "lcm-device-stub-inventory",
+            "options": {
+                "credentials_class": NORNIR_SETTINGS.get("credentials"),
+                "params": NORNIR_SETTINGS.get("inventory_params"),
+                "queryset": queryset,
+            },
+        },
+    )
+
+
+class CreateSoftwareRel(Job):
+    """Queries devices for their OS version and relates them to the matching Software object."""
+
+    name = "Query Device OS Version"
+    description = "Queries devices for their running OS version and links them to the matching Software object."
+    read_only = False
+
+    location = MultiObjectVar(model=Location, required=False)
+    device_type = MultiObjectVar(model=DeviceType, required=False, display_field="model")
+    role = MultiObjectVar(model=Role, required=False)
+    platform = MultiObjectVar(model=Platform, required=False)
+    device = MultiObjectVar(model=Device, required=False)
+    tags = MultiObjectVar(model=Tag, required=False, display_field="name")
+    workers = IntegerVar(
+        required=False,
+        label="Nornir workers",
+        description="Number of parallel device connections. Defaults to the Nornir runner settings.",
+    )
+    only_missing = BooleanVar(
+        default=False,
+        label="Only devices without software",
+        description="Only query devices that have no software relationship yet.",
+    )
+
+    class Meta:
+        """Meta class for the job."""
+
+        has_sensitive_variables = False
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the per-run state populated by run()."""
+        super().__init__(*args, **kwargs)
+        self._device_soft_rel = None
+        self._software_ct = None
+        self._device_ct = None
+        self._existing = {}
+        self._existing_pairs = frozenset()
+        self._results = []
+        self._log_buffer = []
+
+    def run(self, **data):  # pylint: disable=arguments-differ
+        """Query the OS version of each filtered device and create the software relationship."""
+        # These rows never change during a job run; resolve them once instead of per device.
+        self._device_soft_rel = _get_device_soft_rel()
+        self._software_ct = ContentType.objects.get_for_model(SoftwareLCM)
+        self._device_ct = ContentType.objects.get_for_model(Device)
+        # Map of device id to (association pk, software id) for its current relationship.
+        # One query serves both the diff and the in-place updates in reconcile_rels.
+        self._existing = {
+            destination_id: (assoc_pk, source_id)
+            for destination_id, assoc_pk, source_id in RelationshipAssociation.objects.filter(
+                relationship=self._device_soft_rel, destination_type=self._device_ct
+            ).values_list("destination_id", "pk", "source_id")
+        }
+        # Pair set for the common already-correct case: one hash lookup, no dict probing.
+        self._existing_pairs = frozenset(
+            (destination_id, source_id) for destination_id, (_, source_id) in self._existing.items()
+        )
+
+        # Collected as (device, os_version) tuples by the Nornir workers; list.append is atomic.
+        self._results = []
+        self._log_buffer = []
+
+        devices = get_job_filter(data)
+        # The Nornir inventory raises on an empty queryset; with only_missing set a fully
+        # linked fleet is the expected steady state, not a failure.
+        if not devices.exists():
+            self.logger.info("No devices matched the filter; nothing to query.")
+            return
+
+        with init_nornir(devices, workers=data.get("workers")) as nornir_obj:
+            result = nornir_obj.run(task=self.create_software_to_device_rel)
+
+        # Failed hosts never reach the buffered log; report them synchronously at ERROR
+        # level so connect/auth/napalm failures are visible in the UI.
+        for host_name, host_result in result.failed_hosts.items():
+            self.logger.error(
+                "Failed to get OS version from %s: %s", host_name, host_result[0].exception or host_result[0].result
+            )
+
+        if self._log_buffer:
+            JobLogEntry.objects.bulk_create(self._log_buffer, batch_size=500)
+
+        softwares = self.bulk_get_or_create_software()
+        self.reconcile_rels(softwares)
+
+        if result.failed_hosts:
+            raise ValueError(
+                f"Failed to collect the OS version from {len(result.failed_hosts)} of {len(result)} devices."
+            )
+
+    def bulk_get_or_create_software(self):
+        """Resolve the collected (platform, version) pairs to Software objects in bulk.
+
+        Returns a map of (platform id, version) to SoftwareLCM, creating any missing rows
+        with a single bulk_create instead of one get_or_create per device.
+        """
+        platform_versions = {(device_obj.platform_id, os_version) for device_obj, os_version in self._results}
+        softwares = {
+            (software.device_platform_id, software.version): software
+            for software in SoftwareLCM.objects.filter(version__in={version for _, version in platform_versions})
+        }
+        missing = [
+            SoftwareLCM(device_platform_id=platform_id, version=version)
+            for platform_id, version in platform_versions
+            if (platform_id, version) not in softwares
+        ]
+        if missing:
+            SoftwareLCM.objects.bulk_create(missing, ignore_conflicts=True)
+            softwares = {
+                (software.device_platform_id, software.version): software
+                for software in SoftwareLCM.objects.filter(version__in={version for _, version in platform_versions})
+            }
+        return softwares
+
+    def create_software_to_device_rel(self, task):
+        """Get the running OS version from a device and record it for post-processing."""
+        # Each Nornir worker thread owns its own database connection; reset stale ones on
+        # the way in and out so ORM access never stalls on a dead connection mid-run.
+        close_old_connections()
+        device_obj = task.host.data["obj"]
+        os_version = get_version_only(task)
+
+        self._results.append((device_obj, os_version))
+        self._log_info(device_obj.name, f"Device {device_obj.name} reports OS version {os_version}.")
+        close_old_connections()
+
+    def _log_info(self, obj, message):
+        """Buffer an INFO log entry for a single bulk_create after the Nornir run.
+
+        Per-host self.logger calls each persist a JobLogEntry row synchronously, which
+        contends on the job result for large fleets. Errors should still go through
+        self.logger so they reach the UI immediately on failure.
+        """
+        self._log_buffer.append(
+            JobLogEntry(
+                job_result=self.job_result,
+                log_level=LogLevelChoices.LOG_INFO,
+                grouping=self.name,
+                message=message,
+                log_object=str(obj),
+            )
+        )
+
+    def reconcile_rels(self, softwares):
+        """Reconcile the device to software relationships in bulk.
+
+        Nautobot's RelationshipAssociation carries no unique constraint scoped to the
+        destination, so a database-level upsert is not available. Instead, rows whose
+        software changed are rewritten in place with one bulk_update, and only devices
+        with no association at all get new rows via bulk_create — no delete/insert churn.
+        """
+        to_update = {}
+        to_create = []
+        for device_obj, os_version in self._results:
+            software_obj = softwares[(device_obj.platform_id, os_version)]
+            # Steady state after the first run: the pair already exists, nothing to do.
+            if (device_obj.id, software_obj.id) in self._existing_pairs:
+                continue
+            existing = self._existing.get(device_obj.id)
+            if existing is not None:
+                # A device runs a single OS version; point the existing row at the new software.
+                to_update[existing[0]] = software_obj.id
+            else:
+                to_create.append(
+                    RelationshipAssociation(
+                        relationship=self._device_soft_rel,
+                        source_type=self._software_ct,
+                        source_id=software_obj.id,
+                        destination_type=self._device_ct,
+                        destination_id=device_obj.id,
+                    )
+                )
+
+        if to_update:
+            changed = [
+                RelationshipAssociation(pk=assoc_pk, source_type=self._software_ct, source_id=software_id)
+                for assoc_pk, software_id in to_update.items()
+            ]
+            RelationshipAssociation.objects.bulk_update(changed, ["source_type", "source_id"], batch_size=500)
+        if to_create:
+            RelationshipAssociation.objects.bulk_create(to_create, batch_size=500)
@@ -0,0 +1,106 @@
+"""nautobot_device_lifecycle_mgmt test class for the OS version query job."""
+from types import SimpleNamespace
+
+from nautobot.core.testing import TestCase
+from nautobot.dcim.models import Location, Platform
+from nautobot.extras.models import Status
+from nautobot.ipam.models import IPAddress, Namespace, Prefix
+
+from nautobot_device_lifecycle_mgmt.jobs.get_os_version import get_job_filter, get_version_only
+
+from .conftest import create_devices
+
+
+class _FakeNapalmConnection:
+    """Minimal napalm connection double for get_version_only tests."""
+
+    def __init__(self, cli_output="", facts=None):
+        self._cli_output = cli_output
+        self._facts = facts or {}
+        self.cli_commands = []
+        self.get_facts_called = False
+
+    def cli(self, commands):
+        self.cli_commands.extend(commands)
+        return {command: self._cli_output for command in commands}
+
+    def get_facts(self):
+        self.get_facts_called = True
+        return self._facts
+
+
+class _FakeTask:
+    """Minimal Nornir task double exposing what get_version_only reads."""
+
+    def __init__(self, napalm_driver, connection):
+        self.host = SimpleNamespace(
+            data={"napalm_driver": napalm_driver},
+            get_connection=lambda plugin, config: connection,
+        )
+        self.nornir = SimpleNamespace(config=None)
+
+
+class GetJobFilterTest(TestCase):
+    """Test class for the get_job_filter helper."""
+
+    def setUp(self):
+        self.devices = create_devices()
+        namespace = Namespace.objects.get(name="Global")
+        prefix_status = Status.objects.get_for_model(Prefix).first()
+        ip_status = Status.objects.get_for_model(IPAddress).first()
+        Prefix.objects.create(prefix="10.0.0.0/24", namespace=namespace, status=prefix_status)
+        for octet, device in enumerate(self.devices, start=1):
+            device.primary_ip4 = IPAddress.objects.create(
+                address=f"10.0.0.{octet}/24", namespace=namespace, status=ip_status
+            )
+            device.save()
+
+    def test_no_filters_returns_all_devices(self):
+        """Without form selections the job runs against the whole fleet."""
+        self.assertEqual(get_job_filter().count(), len(self.devices))
+
+    def test_platform_filter_narrows_queryset(self):
+        """A platform selection must actually scope the queryset, not be silently dropped."""
+        other_platform, _ = Platform.objects.get_or_create(name="arista_eos")
+        device = self.devices[0]
+        device.platform = other_platform
+        device.save()
+
+        filtered = get_job_filter({"platform": Platform.objects.filter(name="arista_eos")})
+
+        self.assertEqual(list(filtered.values_list("name", flat=True)), [device.name])
+
+    def test_location_filter_narrows_queryset(self):
+        """A location selection must actually scope the queryset, not be silently dropped."""
+        filtered = get_job_filter({"location": Location.objects.filter(name="Location2")})
+
+        self.assertEqual(sorted(filtered.values_list("name", flat=True)), ["sw3"])
+
+
+class GetVersionOnlyTest(TestCase):
+    """Test class for the get_version_only command/regex dispatch."""
+
+    def test_cli_fast_path_for_mapped_driver(self):
+        """A driver with a cheap CLI path must not fall through to get_facts."""
+        connection = _FakeNapalmConnection(cli_output="Cisco IOS Software, Version 15.2(4)M7, RELEASE SOFTWARE (fc2)")
+        task = _FakeTask("ios", connection)
+
+        self.assertEqual(get_version_only(task), "15.2(4)M7")
+        self.assertEqual(connection.cli_commands, ["show version | include Version"])
+        self.assertFalse(connection.get_facts_called)
+
+    def test_get_facts_fallback_for_unmapped_driver(self):
+        """Drivers without a CLI mapping fall back to get_facts."""
+        connection = _FakeNapalmConnection(facts={"os_version": "20.4R3.8"})
+        task = _FakeTask("junos", connection)
+
+        self.assertEqual(get_version_only(task), "20.4R3.8")
+        self.assertEqual(connection.cli_commands, [])
+
+    def test_get_facts_fallback_when_regex_misses(self):
+        """Unparseable CLI output falls back to get_facts instead of failing."""
+        connection = _FakeNapalmConnection(cli_output="", facts={"os_version": "4.27.3M"})
+        task = _FakeTask("eos", connection)
+
+        self.assertEqual(get_version_only(task), "4.27.3M")
+        self.assertTrue(connection.get_facts_called)